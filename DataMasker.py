@@ -2,62 +2,208 @@ __author__ = 'bchan'
 
 import time
 import datetime
-from faker import Factory
-from dateutil.parser import parse
+import functools
+import types
+import uuid as _uuid
 
-fake = Factory.create()
+# Provider backend used by the generate* functions: 'faker' or 'mimesis'
+PROVIDER_BACKEND = 'faker'
+
+# When set, the provider is seeded with RANDOM_SEED once, when it is first
+# created, so runs are reproducible. Nothing reseeds per record.
+DETERMINISTIC_OUTPUT = False
+RANDOM_SEED = 42
+
+# ======================= Provider Backends =====================
+
+class MimesisBackend(object) :
+    # Implements the subset of Faker's provider methods used in this module
+    # on top of mimesis, which draws from preloaded lists instead of going
+    # through Faker's provider lookup on every call.
+    def __init__(self) :
+        from mimesis import Generic
+        from mimesis.enums import Gender
+        from mimesis.locales import Locale
+        generic = Generic(locale=Locale.EN)
+        self._generic = generic
+        self._person = generic.person
+        self._address = generic.address
+        self._payment = generic.payment
+        self._male = Gender.MALE
+        self._female = Gender.FEMALE
+
+    def ssn(self) :
+        randint = self._person.random.randint
+        return "%03d-%02d-%04d" % (randint(1, 665), randint(1, 99), randint(1, 9999))
+
+    def credit_card_number(self) :
+        return self._payment.credit_card_number().replace(" ", "")
+
+    def first_name(self) :
+        return self._person.first_name()
+
+    def first_name_male(self) :
+        return self._person.first_name(gender=self._male)
+
+    def first_name_female(self) :
+        return self._person.first_name(gender=self._female)
+
+    def last_name(self) :
+        return self._person.last_name()
+
+    def street_address(self) :
+        return self._address.address()
+
+    def city(self) :
+        return self._address.city()
+
+    def state_abbr(self) :
+        return self._address.state(abbr=True)
+
+    def postcode(self) :
+        return self._address.postal_code()
+
+    def email(self) :
+        return self._person.email()
+
+    def phone_number(self) :
+        return self._person.phone_number()
+
+    @property
+    def random(self) :
+        return self._person.random
+
+    def seed_instance(self, seed=None) :
+        self._generic.reseed(seed)
+
+def createProvider(backend=None) :
+    if backend is None:
+        backend = PROVIDER_BACKEND
+    if backend == 'faker':
+        from faker import Factory
+        return Factory.create()
+    if backend == 'mimesis':
+        return MimesisBackend()
+    raise ValueError("Unknown provider backend: %s" % backend)
+
+@functools.lru_cache(None)
+def _faker() :
+    # The shared provider is created on first use, so importing this module
+    # (e.g. just for generate_uuid or add_days) doesn't load Faker.
+    provider = createProvider()
+    if DETERMINISTIC_OUTPUT:
+        provider.seed_instance(RANDOM_SEED)
+    return provider
+
+def __getattr__(name) :
+    if name == 'fake':
+        return _faker()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def seed(seed=None) :
+    # Reseeds the shared provider in place, so bound provider methods stay
+    # valid. With no seed, fresh OS entropy is used; worker processes call
+    # this on start so forked copies don't replay the parent's sequence.
+    _faker().seed_instance(seed)
+
+@functools.lru_cache(None)
+def _providers() :
+    # Bound provider methods, resolved once on first use rather than looked
+    # up on the provider for every record
+    fake = _faker()
+    return types.SimpleNamespace(
+        ssn=fake.ssn,
+        creditCard=fake.credit_card_number,
+        firstName=fake.first_name,
+        firstNameByGender={"male": fake.first_name_male,
+                           "female": fake.first_name_female},
+        lastName=fake.last_name,
+        street=fake.street_address,
+        city=fake.city,
+        state=fake.state_abbr,
+        postalCode=fake.postcode,
+        email=fake.email,
+        phone=fake.phone_number)
 
 # ======================= Common Functions =====================
 
 def generate_uuid() :
-    fake = Factory.create()
-    uuid = fake.uuid4()
-    uuid = uuid.replace("-", "").upper()
-    return uuid
+    return _uuid.uuid4().hex.upper()
 
 def generateSSN() :
-    return fake.ssn()
+    return _providers().ssn()
 
 def generateCreditCardNumber() :
-    return fake.credit_card_number();
+    return _providers().creditCard()
 
 def add_days(startdate, days):
   return startdate + datetime.timedelta(days=days)
 
 def generateAddress() :
-    address = {}
-    fullAddress = fake.address()
-    addressParts = fullAddress.splitlines()
-    address["address"] = addressParts[0]
-    if "," in addressParts[1] :
-        cityStateZip = addressParts[1].split(",")
-        stateZip = cityStateZip[1].split()
-        address["city"] = cityStateZip[0]
-        address["state"] = stateZip[0]
-        address["postalCode"] = stateZip[1]
-    else :
-        cityStateZip = addressParts[1].split()
-        address["city"] = cityStateZip[0]
-        address["state"] = cityStateZip[1]
-        address["postalCode"] = cityStateZip[2]
-    return address
+    p = _providers()
+    return {"address": p.street(), "city": p.city(),
+            "state": p.state(), "postalCode": p.postalCode()}
 
 def generateName(gender=None):
-    name = {}
-    if gender is None:
-        name['firstName'] = fake.first_name()
-    else :
-        if gender == 'Male':
-            name['firstName'] = fake.first_name_male()
-        else:
-            name['firstName'] = fake.first_name_female()
-    name["lastName"] = fake.last_name()
-    return name
+    # Unknown or missing gender gets a gender-neutral first name
+    p = _providers()
+    firstName = p.firstNameByGender.get(gender.lower() if gender else None,
+                                        p.firstName)
+    return {"firstName": firstName(), "lastName": p.lastName()}
 
 def generateContact() :
-    contact = {}
-    contact["email"] = fake.email()
-    contact["phone"] = fake.phone_number()
-    return contact
+    p = _providers()
+    return {"email": p.email(), "phone": p.phone()}
+
+
+# ======================= Batch Functions =====================
+
+# Names and addresses are sampled from this many pre-drawn values when a
+# batch is generated from the pool
+POOL_SIZE = 2000
+
+def build_pool(k=POOL_SIZE) :
+    p = _providers()
+    pool = {}
+    pool["firstName"] = [p.firstName() for _ in range(k)]
+    pool["lastName"] = [p.lastName() for _ in range(k)]
+    pool["address"] = [p.street() for _ in range(k)]
+    pool["city"] = [p.city() for _ in range(k)]
+    pool["state"] = [p.state() for _ in range(k)]
+    pool["postalCode"] = [p.postalCode() for _ in range(k)]
+    return pool
+
+def generate_batch_columns(n, pool=None) :
+    # pool is a build_pool() result to sample names and addresses from
+    p = _providers()
+    ssn = p.ssn
+    creditCard = p.creditCard
+    email = p.email
+    phone = p.phone
 
+    # Identifiers and contacts are always drawn fresh
+    columns = {}
+    columns["ssn"] = [ssn() for _ in range(n)]
+    columns["creditCard"] = [creditCard() for _ in range(n)]
+    columns["email"] = [email() for _ in range(n)]
+    columns["phone"] = [phone() for _ in range(n)]
+    if pool is not None:
+        choices = _faker().random.choices
+        for field in ("firstName", "lastName", "address", "city", "state",
+                      "postalCode"):
+            columns[field] = choices(pool[field], k=n)
+        return columns
 
+    firstName = p.firstName
+    lastName = p.lastName
+    street = p.street
+    city = p.city
+    state = p.state
+    postalCode = p.postalCode
+    columns["firstName"] = [firstName() for _ in range(n)]
+    columns["lastName"] = [lastName() for _ in range(n)]
+    columns["address"] = [street() for _ in range(n)]
+    columns["city"] = [city() for _ in range(n)]
+    columns["state"] = [state() for _ in range(n)]
+    columns["postalCode"] = [postalCode() for _ in range(n)]
+    return columns
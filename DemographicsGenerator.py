@@ -3,51 +3,172 @@ __author__ = 'bchan'
 import time
 import sys
 import csv
+import json
+import multiprocessing
 import DataMasker
-from dateutil.parser import parse
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = ['ssn','creditCard','firstName','lastName',
+          'address','city','state','postalCode','email','phone']
+
+if pa is not None:
+    _SCHEMA = pa.schema([(field, pa.string()) for field in FIELDS])
+
+# Records are generated and written this many at a time
+CHUNK_SIZE = 1024
+
+# Batches smaller than this are generated in-process
+PARALLEL_THRESHOLD = 1000
+
+# Parquet row groups hold at least this many records
+ROW_GROUP_SIZE = 65536
+
+# Batches larger than this sample names and addresses from DataMasker's
+# value pool instead of calling the provider per record
+POOL_THRESHOLD = 10000
 
 def generateDemographics() :
-    member = {}
-    member["ssn"] = DataMasker.generateSSN()
-    member['creditCard'] = DataMasker.generateCreditCardNumber()
-    name = DataMasker.generateName()
-    member['firstName'] = name['firstName']
-    member['lastName'] = name['lastName']
-
-    # Address
-    address = DataMasker.generateAddress()
-    member['address'] = address["address"]
-    member['city'] =  address["city"]
-    member['state'] = address["state"]
-    member['postalCode'] = address["postalCode"]
-
-    # Contact
-    contact = DataMasker.generateContact()
-    member["phone"] = contact["phone"]
-    member["email"] = contact["email"]
-
-    return member
-
-
-def main(records):
-    start = time.time()
-    list = []
-    for x in range(0, records):
-        list.append(generateDemographics())
-
-    with open('demographicsData.csv', 'w') as outFile:
-        fieldnames = ['ssn','creditCard','firstName','lastName',
-                      'address','city','state','postalCode','email','phone']
-        writer = csv.DictWriter(outFile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in list:
-            writer.writerow(row)
-    outFile.close()
-    end = time.time()
-    elapsed = end - start
+    return {"ssn": DataMasker.generateSSN(),
+            "creditCard": DataMasker.generateCreditCardNumber(),
+            **DataMasker.generateName(),
+            **DataMasker.generateAddress(),
+            **DataMasker.generateContact()}
+
+
+def _gen_columns(records, valuePool):
+    return DataMasker.generate_batch_columns(records, valuePool)
+
+
+def _gen_chunk(records, valuePool):
+    # Rows are tuples in FIELDS order
+    columns = _gen_columns(records, valuePool)
+    return list(zip(*[columns[field] for field in FIELDS]))
+
+
+# Value pool handed to each worker process by _init_worker
+_workerPool = None
+
+def _init_worker(valuePool):
+    global _workerPool
+    DataMasker.seed()
+    _workerPool = valuePool
+
+
+def _run_in_worker(task):
+    genChunk, records = task
+    return genChunk(records, _workerPool)
+
+
+def _iter_chunks(records, genChunk):
+    # The pool is built once here, before any workers exist, and passed to
+    # each of them rather than rebuilt per process
+    valuePool = DataMasker.build_pool() if records > POOL_THRESHOLD else None
+    # Deterministic output relies on the one seeded provider in this process
+    workers = multiprocessing.cpu_count()
+    if (records < PARALLEL_THRESHOLD or workers == 1
+            or DataMasker.DETERMINISTIC_OUTPUT):
+        for base in range(0, records, CHUNK_SIZE):
+            yield genChunk(min(CHUNK_SIZE, records - base), valuePool)
+        return
+    chunkSize = max(1, min(CHUNK_SIZE, records // (8 * workers)))
+    tasks = [(genChunk, chunkSize)] * (records // chunkSize)
+    if records % chunkSize:
+        tasks.append((genChunk, records % chunkSize))
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(valuePool,)) as pool:
+        yield from pool.imap_unordered(_run_in_worker, tasks)
+
+
+def generate_iter(records):
+    for chunk in _iter_chunks(records, _gen_chunk):
+        yield from chunk
+
+
+def generate_columns(records):
+    # Yields one dict of column lists per chunk
+    return _iter_chunks(records, _gen_columns)
+
+
+def save_to_csv(rows, filename):
+    with open(filename, 'w', newline='', encoding='utf-8',
+              buffering=1 << 20) as outFile:
+        writer = csv.writer(outFile)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+
+
+def save_columns_to_csv(chunks, filename):
+    with pacsv.CSVWriter(filename, _SCHEMA) as writer:
+        for columns in chunks:
+            writer.write_table(pa.Table.from_pydict(columns, schema=_SCHEMA))
+
+
+def save_to_ndjson(rows, filename):
+    if orjson is not None:
+        dumps = orjson.dumps
+    else:
+        def dumps(record):
+            return json.dumps(record, ensure_ascii=False,
+                              separators=(',', ':')).encode('utf-8')
+    with open(filename, 'wb', buffering=1 << 20) as outFile:
+        outFile.writelines(dumps(dict(zip(FIELDS, row))) + b"\n"
+                           for row in rows)
+
+
+def save_columns_to_parquet(chunks, filename):
+    with pq.ParquetWriter(filename, _SCHEMA) as writer:
+        tables = []
+        pending = 0
+        for columns in chunks:
+            table = pa.Table.from_pydict(columns, schema=_SCHEMA)
+            tables.append(table)
+            pending += table.num_rows
+            if pending >= ROW_GROUP_SIZE:
+                writer.write_table(pa.concat_tables(tables))
+                tables = []
+                pending = 0
+        if tables:
+            writer.write_table(pa.concat_tables(tables))
+
+
+def main(records, filename='demographicsData.csv', columnar=False):
+    # Output format follows the file extension: .csv, .jsonl or .parquet.
+    # CSV is written with the stdlib writer unless columnar is set, which
+    # uses pyarrow's writer instead (every field quoted, LF line endings).
+    start = time.perf_counter_ns()
+    if filename.endswith(('.jsonl', '.ndjson')):
+        save_to_ndjson(generate_iter(records), filename)
+    elif filename.endswith('.parquet'):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet output")
+        save_columns_to_parquet(generate_columns(records), filename)
+    elif columnar:
+        if pa is None:
+            raise ImportError("pyarrow is required for columnar CSV output")
+        save_columns_to_csv(generate_columns(records), filename)
+    else:
+        save_to_csv(generate_iter(records), filename)
+    elapsed_ns = max(time.perf_counter_ns() - start, 1)
+    print('Generated %d records in %.3f s (%d records/s)'
+          % (records, elapsed_ns / 1e9, records * 1000000000 // elapsed_ns))
 
 if __name__ == "__main__":
     records = 100
+    args = sys.argv[1:]
+    columnar = '--columnar' in args
+    args = [arg for arg in args if arg != '--columnar']
+    filename = args[0] if args else 'demographicsData.csv'
     print('Generating %d records'% records)
-    main(records)
+    main(records, filename, columnar)
 
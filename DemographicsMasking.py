@@ -1,58 +1,146 @@
 __author__ = 'bchan'
 
 import time
+import datetime
 
 import csv
+import itertools
+import multiprocessing
 import DataMasker
-from dateutil.parser import parse
 
-def generateDemographics(input) :
-    member = {}
-    member["ssn"] = DataMasker.generateSSN()
+FIELDS = ['ssn','birthDate','gender','firstName','lastName',
+          'address','city','state','postalCode','email','phone']
+
+# Birth dates are read and written as mm-dd-yyyy and shifted by this many days
+DATE_FORMAT = '%m-%d-%Y'
+DATE_SHIFT_DAYS = 10
+
+# Input rows are masked this many at a time
+CHUNK_SIZE = 1024
+
+# Input columns the masking reads
+REQUIRED_FIELDS = frozenset(['birthDate', 'gender'])
+
+# Raised by malformed input rows (missing columns, unparseable dates)
+_MASK_ERRORS = (KeyError, TypeError, ValueError)
+
+def parseBirthDate(value) :
+    # Source data uses DATE_FORMAT; only fall back to dateutil's heuristic
+    # parser for anything else.
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        from dateutil.parser import parse
+        return parse(value)
+
+def generateDemographics(input, shiftDays=DATE_SHIFT_DAYS) :
+    shift = datetime.timedelta(days=shiftDays)
+    return dict(zip(FIELDS, _maskRecord(input, shift, DATE_FORMAT)))
+
+def _maskRecord(input, shift, fmt) :
+    # Returns the masked record as a tuple in FIELDS order
     # Shift BirthDate
-    bDate = parse(input["birthDate"])
-    member['birthDate'] = DataMasker.add_days(bDate, 10).strftime('%m-%d-%Y')
+    bDate = parseBirthDate(input["birthDate"])
+    birthDate = (bDate + shift).strftime(fmt)
 
     # Name acccording to gender
-    member['gender'] = input['gender']
-    name = DataMasker.generateName(member['gender'])
-    member['firstName'] = name['firstName']
-    member['lastName'] = name['lastName']
+    gender = input['gender']
+    name = DataMasker.generateName(gender)
 
-    # Address
     address = DataMasker.generateAddress()
-    member['address'] = address["address"]
-    member['city'] =  address["city"]
-    member['state'] = address["state"]
-    member['postalCode'] = address["postalCode"]
-
-    # Contact
     contact = DataMasker.generateContact()
-    member["phone"] = contact["phone"]
-    member["email"] = contact["email"]
 
-    return member
+    return (DataMasker.generateSSN(), birthDate, gender,
+            name['firstName'], name['lastName'],
+            address["address"], address["city"], address["state"],
+            address["postalCode"], contact["email"], contact["phone"])
 
 
-def main():
-    start = time.time()
-    list = []
-    with open('data/demographics.csv') as inFile:
+def _findBadRecord(records, start, shift, fmt) :
+    # Slow path after a chunk failed: remask record by record to report
+    # which input record is at fault.
+    for i, record in enumerate(records):
+        try:
+            _maskRecord(record, shift, fmt)
+        except _MASK_ERRORS as e:
+            raise ValueError("Cannot mask record %d: %r" % (start + i, e)) from e
+
+
+def _iterPayloads(rows, shift) :
+    rows = iter(rows)
+    start = 1
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk, start, shift
+        start += len(chunk)
+
+
+def _maskPayload(payload) :
+    chunk, start, shift = payload
+    fmt = DATE_FORMAT
+    try:
+        return [_maskRecord(record, shift, fmt) for record in chunk]
+    except _MASK_ERRORS:
+        _findBadRecord(chunk, start, shift, fmt)
+        raise
+
+
+def mask_iter(rows, shiftDays=DATE_SHIFT_DAYS):
+    payloads = _iterPayloads(rows, datetime.timedelta(days=shiftDays))
+    first = next(payloads, None)
+    if first is None:
+        return
+    # Input that fits in one chunk, and deterministic runs, stay in-process
+    workers = multiprocessing.cpu_count()
+    if (len(first[0]) < CHUNK_SIZE or workers == 1
+            or DataMasker.DETERMINISTIC_OUTPUT):
+        for payload in itertools.chain([first], payloads):
+            yield from _maskPayload(payload)
+        return
+    # imap keeps results in input order
+    with multiprocessing.Pool(workers, initializer=DataMasker.seed) as pool:
+        for masked in pool.imap(_maskPayload, itertools.chain([first], payloads)):
+            yield from masked
+
+
+def iter_demographics(filename):
+    # The header is checked before returning, so a bad input fails before
+    # any output file is opened. DictReader already skips blank lines.
+    inFile = open(filename, newline='', encoding='utf-8')
+    try:
         reader = csv.DictReader(inFile)
-        for row in reader:
-            result = generateDemographics(row)
-            list.append(result)
-    inFile.close()
-    with open('demographicsMasked.csv', 'w') as outFile:
-        fieldnames = ['ssn','birthDate','gender','firstName','lastName',
-                      'address','city','state','postalCode','email','phone']
-        writer = csv.DictWriter(outFile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in list:
-            writer.writerow(row)
-    outFile.close()
-    end = time.time()
-    elapsed = end - start
+        missing = REQUIRED_FIELDS.difference(reader.fieldnames or ())
+        if missing:
+            raise ValueError("%s is missing columns: %s"
+                             % (filename, ", ".join(sorted(missing))))
+    except BaseException:
+        inFile.close()
+        raise
+    return _iterRows(inFile, reader)
+
+
+def _iterRows(inFile, reader):
+    with inFile:
+        yield from reader
+
+
+def save_masked_data(rows, filename):
+    with open(filename, 'w', newline='', encoding='utf-8',
+              buffering=1 << 20) as outFile:
+        writer = csv.writer(outFile)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+
+
+def main():
+    start = time.perf_counter_ns()
+    inputFile = 'data/demographics.csv'
+    rows = iter_demographics(inputFile)
+    save_masked_data(mask_iter(rows), 'demographicsMasked.csv')
+    elapsed_ns = time.perf_counter_ns() - start
+    print('Masked %s in %.3f s' % (inputFile, elapsed_ns / 1e9))
 
 if __name__ == "__main__":
     main()